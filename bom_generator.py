@@ -1,23 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
-import json
 import os
-import subprocess
 import sys
 from pathlib import Path
-import requests
 from dotenv import load_dotenv
+from mouser_search import get_session
+
+_SESSION = get_session()
 
 def read_requirements(requirements_file):
     """Read the requirements file."""
     with open(requirements_file, 'r') as f:
         return f.read().strip()
 
-def generate_bom_prompt(requirements):
-    """Generate the prompt for Claude to create a BOM."""
-    return f"""You are an electronics design expert. I need you to create a Bill of Materials (BOM) for a project with these requirements:
+BOM_PROMPT_TMPL = """You are an electronics design expert. I need you to create a Bill of Materials (BOM) for a project with these requirements:
 
 {requirements}
 
@@ -50,6 +47,10 @@ R1,10k,Pull-up_resistor,0805,1
 
 Return ONLY the CSV content with exact formatting as shown above."""
 
+def generate_bom_prompt(requirements):
+    """Generate the prompt for Claude to create a BOM."""
+    return BOM_PROMPT_TMPL.format_map({'requirements': requirements})
+
 def get_claude_bom(requirements, api_key):
     """Call Claude API to generate the BOM."""
     headers = {
@@ -67,7 +68,7 @@ def get_claude_bom(requirements, api_key):
         }]
     }
     
-    response = requests.post(
+    response = _SESSION.post(
         'https://api.anthropic.com/v1/messages',
         headers=headers,
         json=data
@@ -85,23 +86,14 @@ def save_bom_csv(bom_content, output_file):
         f.write(bom_content)
 
 def process_bom_with_mouser(bom_file, context, output_file):
-    """Process the BOM with bom_processor.py."""
-    python_path = os.path.expanduser('~/miniconda3/bin/python')
-    processor_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bom_processor.py')
-    
-    cmd = [
-        python_path,
-        processor_path,
-        bom_file,
-        context,
-        output_file
-    ]
-    
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"Error processing BOM: {result.stderr}", file=sys.stderr)
+    """Process the BOM with bom_processor.process_bom."""
+    # Imported here so --help and BOM generation don't load the processor
+    from bom_processor import process_bom
+    try:
+        return process_bom(bom_file, context, output_file)
+    except Exception as e:
+        print(f"Error processing BOM: {str(e)}", file=sys.stderr)
         return False
-    return True
 
 def main():
     parser = argparse.ArgumentParser(description='Generate and process a BOM from project requirements')
@@ -2,24 +2,68 @@
 
 import argparse
 import csv
-import subprocess
 import sys
+import threading
 import time
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import os
-import requests
 import json
+import requests
 from dotenv import load_dotenv
+from mouser_search import get_session, search
+from response_cache import cache_key, get_cached, get_cached_many, set_cached, set_cached_many
+
+# Number of BOM rows processed concurrently
+MAX_WORKERS = 8
+# Claude rate limits shared by all workers (requests and tokens per minute)
+CLAUDE_RPM = 50
+CLAUDE_TPM = 40000
+# Estimated tokens for one part-selection request (parts list + response)
+SELECTION_TOKEN_ESTIMATE = 3000
+# Number of BOM rows sent to Claude in one query-generation request
+QUERY_BATCH_SIZE = 10
+# Number of finished rows buffered before writing them to the output CSV
+WRITE_BATCH_SIZE = 8
+# Model used to turn BOM rows into search queries
+QUERY_MODEL = "claude-3-sonnet-20240229"
+
+_SESSION = get_session()
+
+class RateLimiter:
+    """Token bucket limiting requests and tokens per minute across threads."""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens=0):
+        """Block until one request using about `tokens` tokens is allowed."""
+        tokens = min(tokens, self.tpm)
+        with self._condition:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max((1 - self._requests) * 60 / self.rpm,
+                           (tokens - self._tokens) * 60 / self.tpm)
+                self._condition.wait(wait)
 
-def get_claude_query(component, context):
-    """Get search query from Claude based on component details."""
-    prompt = f"""Given this electronic component from a BOM:
-Reference: {component['Reference']}
-Value: {component['Value']}
-Description: {component['Description']}
-Footprint: {component['Footprint']}
+claude_limiter = RateLimiter(CLAUDE_RPM, CLAUDE_TPM)
 
-And this project context: {context}
+QUERY_SYSTEM_PROMPT = """You turn electronic components from a BOM into Mouser Electronics search queries.
 
 Generate a simple search query for Mouser Electronics that will return a broad list of potential parts.
 Focus on the essential characteristics only - value and package/footprint.
@@ -33,7 +77,21 @@ Use: "100uF 0805 capacitor"
 Instead of: "1k 1% 125mW 0805 thick film resistor"
 Use: "1k 0805 resistor"
 
-Return ONLY the search query, nothing else."""
+You will be given a numbered list of components.
+Return ONLY a JSON array of search-query strings, one per component, in order, nothing else."""
+
+COMPONENT_LINE_TMPL = "{index}. Reference: {Reference}, Value: {Value}, Description: {Description}, Footprint: {Footprint}\n"
+
+def request_queries(components, context):
+    """Ask Claude for one search query per component.
+
+    Returns the queries in order, [None] * len(components) if the request
+    failed, or None if the response could not be matched to the components.
+    """
+    system = f"{QUERY_SYSTEM_PROMPT}\n\nProject context: {context}"
+    prompt = "Given these electronic components from a BOM:\n"
+    for i, component in enumerate(components, 1):
+        prompt += COMPONENT_LINE_TMPL.format_map({**component, 'index': i})
 
     headers = {
         "x-api-key": os.getenv("CLAUDE_API_KEY"),
@@ -42,54 +100,94 @@ Return ONLY the search query, nothing else."""
     }
 
     data = {
-        "model": "claude-3-sonnet-20240229",
-        "max_tokens": 100,
+        "model": QUERY_MODEL,
+        "max_tokens": 100 * len(components),
+        "system": system,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.1
     }
 
-    response = requests.post(
-        "https://api.anthropic.com/v1/messages",
-        headers=headers,
-        json=data
-    )
+    # Roughly 4 characters per input token, plus the response budget
+    claude_limiter.acquire((len(system) + len(prompt)) // 4 + data["max_tokens"])
+    try:
+        response = _SESSION.post(
+            "https://api.anthropic.com/v1/messages",
+            headers=headers,
+            json=data
+        )
+
+        if response.status_code != 200:
+            print(f"Error from Claude API: {response.status_code}")
+            print(response.text)
+            return [None] * len(components)
 
-    if response.status_code == 200:
         print(f"Claude API response status: {response.status_code}")
-        result = response.json()
-        query = result['content'][0]['text'].strip()
-        print(f"Generated query: {query}")
-        return query
-    else:
-        print(f"Error from Claude API: {response.status_code}")
-        print(response.text)
-        return None
+        text = response.json()['content'][0]['text'].strip()
+    except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+        print(f"Error calling Claude API: {str(e)}", file=sys.stderr)
+        return [None] * len(components)
 
-def mouser_search(query, context, api_key):
-    """Search Mouser API for parts using mouser_search.py."""
-    python_path = sys.executable  # Use the current Python interpreter
-    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mouser_search.py')
-    cmd = [python_path, script_path, '--query', query, '--verbose']
-    if context:
-        cmd.extend(['--context', context])
-    
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        print(result.stdout)  # Print verbose output
-        
-        if result.returncode != 0:
-            print(f"Error running mouser_search.py: {result.stderr}", file=sys.stderr)
-            return None
-        
-        # Extract Mouser part number from the verbose output
-        for line in result.stdout.split('\n'):
-            if line.startswith('Mouser Part Number:'):
-                return line.split(':')[1].strip()
-        return None
-    except Exception as e:
-        print(f"Error executing command: {str(e)}", file=sys.stderr)
+        queries = json.loads(text[text.find('['):text.rfind(']') + 1])
+    except json.JSONDecodeError:
+        queries = None
+    if not isinstance(queries, list) or len(queries) != len(components):
+        print(f"Could not parse queries from Claude response: {text}")
         return None
 
+    queries = [str(query).strip() or None if query else None for query in queries]
+    for component, query in zip(components, queries):
+        print(f"Generated query for {component['Reference']}: {query}")
+    return queries
+
+def get_claude_queries_batch(components, context):
+    """Get search queries from Claude for a batch of components.
+
+    Returns a list with one query per component, in order; entries are None
+    when Claude's response could not be used. If the batch response can't be
+    parsed, each component is retried once on its own, so a batch costs at
+    most len(components) + 1 requests.
+    """
+    queries = request_queries(components, context)
+    if queries is not None:
+        return queries
+    if len(components) == 1:
+        return [None]
+    return [(request_queries([component], context) or [None])[0] for component in components]
+
+def component_cache_key(component, context):
+    """Cache key for the search query generated for a component."""
+    return cache_key('query', QUERY_MODEL, component['Value'], component['Footprint'],
+                     component['Description'], context)
+
+def get_claude_queries_cached(components, context):
+    """Get search queries for components, asking Claude only for cache misses."""
+    keys = [component_cache_key(component, context) for component in components]
+    cached = get_cached_many(keys)
+    queries = [cached.get(key) for key in keys]
+    missing = [i for i, query in enumerate(queries) if query is None]
+    if missing:
+        generated = get_claude_queries_batch([components[i] for i in missing], context)
+        for i, query in zip(missing, generated):
+            queries[i] = query
+        set_cached_many([(keys[i], queries[i]) for i in missing if queries[i]])
+    return queries
+
+def mouser_search(query, context, api_key):
+    """Search Mouser API for parts using mouser_search.search."""
+    key = cache_key('part', query, context or '')
+    part_number = get_cached(key)
+    if part_number:
+        return part_number
+
+    # Not verbose: its multi-line output would interleave across worker threads.
+    # The limiter is only charged once Mouser returned parts for Claude to pick from.
+    part_number = search(query, context, api_key,
+                         before_claude=lambda: claude_limiter.acquire(SELECTION_TOKEN_ESTIMATE))
+    if part_number:
+        set_cached(key, part_number)
+    return part_number
+
 def mask_api_key(key):
     """Mask an API key for safe printing."""
     if not key:
@@ -105,10 +203,10 @@ def process_bom(input_file, context, output_file):
     
     if not mouser_api_key:
         print("Error: MOUSER_API_KEY not found in .env file", file=sys.stderr)
-        return
+        return False
     if not claude_api_key:
         print("Error: CLAUDE_API_KEY not found in .env file", file=sys.stderr)
-        return
+        return False
     
     # Read existing parts if output file exists
     existing_parts = {}
@@ -124,32 +222,58 @@ def process_bom(input_file, context, output_file):
         reader = csv.DictReader(f)
         rows = list(reader)
     
-    # Create output file with headers
-    with open(output_file, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=['Reference', 'Value', 'Description', 'Footprint', 'Quantity', 'MouserPartNumber'])
-        writer.writeheader()
-        
-        for row in rows:
-            # Skip if we already have a part number
-            if row['Reference'] in existing_parts:
-                row['MouserPartNumber'] = existing_parts[row['Reference']]
-                writer.writerow(row)
-                continue
-                
-            # Get search query from Claude
-            print(f"\nProcessing component: {row['Reference']} ({row['Value']})")
-            query = get_claude_query(row, context)
-            
-            if query:
-                print(f"Search query: {query}")
-                part_number = mouser_search(query, context, mouser_api_key)
-                row['MouserPartNumber'] = part_number if part_number else ''
-            else:
-                print(f"No search query generated for {row['Reference']}")
-                row['MouserPartNumber'] = ''
-            
-            writer.writerow(row)
-            time.sleep(1)  # Rate limit for API calls
+    # Skip rows we already have a part number for
+    for row in rows:
+        if row['Reference'] in existing_parts:
+            row['MouserPartNumber'] = existing_parts[row['Reference']]
+    pending = [i for i, row in enumerate(rows) if row['Reference'] not in existing_parts]
+    batches = [pending[i:i + QUERY_BATCH_SIZE] for i in range(0, len(pending), QUERY_BATCH_SIZE)]
+
+    def query_batch(batch):
+        return get_claude_queries_cached([rows[i] for i in batch], context)
+
+    def process_row(row, query):
+        if row['Reference'] in existing_parts:
+            return row
+
+        # Collect the row's output and print it in one call so rows don't interleave
+        lines = [f"\nProcessing component: {row['Reference']} ({row['Value']})"]
+        if query:
+            lines.append(f"Search query: {query}")
+            part_number = mouser_search(query, context, mouser_api_key)
+            row['MouserPartNumber'] = part_number if part_number else ''
+            lines.append(f"Mouser Part Number: {part_number}" if part_number else "No part found")
+        else:
+            lines.append(f"No search query generated for {row['Reference']}")
+            row['MouserPartNumber'] = ''
+        print('\n'.join(lines) + '\n', end='')
+        return row
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # Resolve every query before the output file is truncated for rewriting
+        queries = [None] * len(rows)
+        for batch, batch_queries in zip(batches, executor.map(query_batch, batches)):
+            for i, query in zip(batch, batch_queries):
+                queries[i] = query
+
+        # Create output file with headers
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['Reference', 'Value', 'Description', 'Footprint', 'Quantity', 'MouserPartNumber'])
+            writer.writeheader()
+
+            # Rows are looked up concurrently but written in BOM order as they finish
+            buf = []
+            try:
+                for row in executor.map(process_row, rows, queries):
+                    buf.append(row)
+                    if len(buf) >= WRITE_BATCH_SIZE:
+                        writer.writerows(buf)
+                        f.flush()
+                        buf.clear()
+            finally:
+                # Keep rows that already finished even if the run is interrupted
+                writer.writerows(buf)
+    return True
 
 def main():
     parser = argparse.ArgumentParser(description='Process a BOM CSV and find Mouser parts for each component')
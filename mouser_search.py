@@ -1,13 +1,33 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
 import os
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import sys
 
+def create_session():
+    """Create a pooled HTTP session that retries rate-limit and server errors."""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['POST'],
+        raise_on_status=False
+    )
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+_SESSION = create_session()
+
+def get_session():
+    """Return the session shared by every module that calls Claude or Mouser."""
+    return _SESSION
+
 def search_mouser_parts(keyword, api_key):
     url = f'https://api.mouser.com/api/v1/search/keyword?apiKey={api_key}'
     headers = {
@@ -24,28 +44,36 @@ def search_mouser_parts(keyword, api_key):
         }
     }
     
-    response = requests.post(url, headers=headers, json=data)
+    response = _SESSION.post(url, headers=headers, json=data)
     return response.json()
 
+RECOMMENDATION_PROMPT_TMPL = """Here is a list of parts for the query "{query}". Please evaluate this list and select a single part that best fits our use case. When selecting from this list, balance for a part that's cheaper, from a known vendor, documentation and footprints, and common or well documented.{context_text}
+
+Here are the parts:
+
+{parts_text}
+
+Return your answer in the following format so it can be easily parsed. Use EXACTLY the part number as shown in the list above, do not add manufacturer name or any other text:
+[ManufacturerPartNumber:95J3R0E]"""
+
+PART_TMPL = "Manufacturer: {Manufacturer}\nPart Number: {ManufacturerPartNumber}\nDescription: {Description}\n"
+
 def get_claude_recommendation(parts, query, context, api_key):
     # Format the parts list for Claude
-    parts_text = "Here are the parts:\n\n"
+    parts_text = ""
     for part in parts:
-        parts_text += f"Manufacturer: {part['Manufacturer']}\n"
-        parts_text += f"Part Number: {part['ManufacturerPartNumber']}\n"
-        parts_text += f"Description: {part['Description']}\n"
+        parts_text += PART_TMPL.format_map(part)
         if part.get('PriceBreaks'):
             parts_text += f"Price: {part['PriceBreaks'][0]['Price']}\n"
         parts_text += "---\n"
 
     context_text = f"\nContext: This part will be used for {context}." if context else ""
 
-    prompt = f"""Here is a list of parts for the query "{query}". Please evaluate this list and select a single part that best fits our use case. When selecting from this list, balance for a part that's cheaper, from a known vendor, documentation and footprints, and common or well documented.{context_text}
-
-{parts_text}
-
-Return your answer in the following format so it can be easily parsed. Use EXACTLY the part number as shown in the list above, do not add manufacturer name or any other text:
-[ManufacturerPartNumber:95J3R0E]"""
+    prompt = RECOMMENDATION_PROMPT_TMPL.format_map({
+        'query': query,
+        'context_text': context_text,
+        'parts_text': parts_text
+    })
 
     headers = {
         'x-api-key': api_key,
@@ -59,7 +87,7 @@ Return your answer in the following format so it can be easily parsed. Use EXACT
         'messages': [{'role': 'user', 'content': prompt}]
     }
     
-    response = requests.post(
+    response = _SESSION.post(
         'https://api.anthropic.com/v1/messages',
         headers=headers,
         json=data
@@ -78,6 +106,71 @@ def extract_manufacturer_part_number(claude_response):
         return match.group(1)
     return None
 
+def select_part(query, context, mouser_api_key, claude_api_key, verbose=False, before_claude=None):
+    """Search Mouser for a query and return the part Claude recommends.
+
+    before_claude, if given, is called right before Claude is asked, e.g. to
+    wait on a rate limiter. Errors are reported on stderr and None is returned.
+    """
+    # Get parts from Mouser
+    result = search_mouser_parts(query, mouser_api_key)
+    
+    if result.get('Errors'):
+        print(f"Error: {result['Errors']}", file=sys.stderr)
+        return None
+
+    parts = result.get('SearchResults', {}).get('Parts', [])
+    if not parts:
+        print("No parts found matching your search criteria.", file=sys.stderr)
+        return None
+
+    # Get Claude's recommendation
+    if before_claude:
+        before_claude()
+    claude_response = get_claude_recommendation(parts, query, context, claude_api_key)
+    if verbose:
+        print("\nClaude's response:")
+        print(claude_response)
+    
+    recommended_part_number = extract_manufacturer_part_number(claude_response)
+    if verbose:
+        print(f"\nExtracted part number: {recommended_part_number}")
+
+    if not recommended_part_number:
+        print("Could not parse Claude's recommendation", file=sys.stderr)
+        return None
+
+    # Find the recommended part
+    recommended_part = next((part for part in parts if part['ManufacturerPartNumber'] == recommended_part_number), None)
+    
+    if recommended_part:
+        if verbose:
+            print("\nRecommended Part:")
+            print(f"Mouser Part Number: {recommended_part['MouserPartNumber']}")
+            print(f"Description: {recommended_part['Description']}")
+            print(f"Manufacturer: {recommended_part['Manufacturer']}")
+            print(f"Manufacturer Part Number: {recommended_part['ManufacturerPartNumber']}")
+            if recommended_part.get('PriceBreaks'):
+                print(f"Price: {recommended_part['PriceBreaks'][0]['Price']}")
+    elif verbose:
+        print(f"\nCould not find recommended part number: {recommended_part_number}")
+        print("\nAvailable part numbers:")
+        for part in parts:
+            print(f"- {part['ManufacturerPartNumber']}")
+    else:
+        print(f"Error: Could not find recommended part", file=sys.stderr)
+    return recommended_part
+
+def search(query, context, api_key, claude_api_key=None, verbose=False, before_claude=None):
+    """Return the Mouser part number Claude selects for a query, or None."""
+    claude_api_key = claude_api_key or os.getenv('CLAUDE_API_KEY')
+    try:
+        part = select_part(query, context, api_key, claude_api_key, verbose, before_claude)
+    except Exception as e:
+        print(f"Error occurred: {str(e)}", file=sys.stderr)
+        return None
+    return part['MouserPartNumber'] if part else None
+
 def main():
     parser = argparse.ArgumentParser(description='Search for Mouser parts')
     parser.add_argument('-q', '--query', required=True, help='Search query (e.g., "500ohm smd 0805 resistor")')
@@ -98,58 +191,9 @@ def main():
         print("Error: CLAUDE_API_KEY not found in .env file", file=sys.stderr)
         return
 
-    try:
-        # Get parts from Mouser
-        result = search_mouser_parts(args.query, mouser_api_key)
-        
-        if result.get('Errors'):
-            print(f"Error: {result['Errors']}", file=sys.stderr)
-            return
-
-        parts = result.get('SearchResults', {}).get('Parts', [])
-        if not parts:
-            print("No parts found matching your search criteria.", file=sys.stderr)
-            return
-
-        # Get Claude's recommendation
-        claude_response = get_claude_recommendation(parts, args.query, args.context, claude_api_key)
-        if args.verbose:
-            print("\nClaude's response:")
-            print(claude_response)
-        
-        recommended_part_number = extract_manufacturer_part_number(claude_response)
-        if args.verbose:
-            print(f"\nExtracted part number: {recommended_part_number}")
-
-        if not recommended_part_number:
-            print("Could not parse Claude's recommendation", file=sys.stderr)
-            return
-
-        # Find and display the recommended part
-        recommended_part = next((part for part in parts if part['ManufacturerPartNumber'] == recommended_part_number), None)
-        
-        if recommended_part:
-            if args.verbose:
-                print("\nRecommended Part:")
-                print(f"Mouser Part Number: {recommended_part['MouserPartNumber']}")
-                print(f"Description: {recommended_part['Description']}")
-                print(f"Manufacturer: {recommended_part['Manufacturer']}")
-                print(f"Manufacturer Part Number: {recommended_part['ManufacturerPartNumber']}")
-                if recommended_part.get('PriceBreaks'):
-                    print(f"Price: {recommended_part['PriceBreaks'][0]['Price']}")
-            else:
-                print(recommended_part['MouserPartNumber'])
-        else:
-            if args.verbose:
-                print(f"\nCould not find recommended part number: {recommended_part_number}")
-                print("\nAvailable part numbers:")
-                for part in parts:
-                    print(f"- {part['ManufacturerPartNumber']}")
-            else:
-                print(f"Error: Could not find recommended part", file=sys.stderr)
-
-    except Exception as e:
-        print(f"Error occurred: {str(e)}", file=sys.stderr)
+    part_number = search(args.query, args.context, mouser_api_key, claude_api_key, args.verbose)
+    if part_number and not args.verbose:
+        print(part_number)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
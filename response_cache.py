@@ -0,0 +1,73 @@
+"""SQLite-backed cache for Claude and Mouser lookups shared across runs."""
+
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+DEFAULT_CACHE_PATH = '~/.cache/part_finder/responses.db'
+# Cached responses expire after 7 days
+CACHE_TTL = 7 * 24 * 60 * 60
+
+def cache_key(*parts):
+    """Build a cache key from the whitespace-normalized parts.
+
+    Case is kept: in part values it carries meaning (1M is megaohm, 1m milliohm).
+    """
+    text = '|'.join(' '.join(str(part).split()) for part in parts)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def _connect():
+    # Resolved per call so PART_FINDER_CACHE set by load_dotenv() after import is honoured
+    cache_path = os.path.expanduser(os.getenv('PART_FINDER_CACHE', DEFAULT_CACHE_PATH))
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=10)
+    conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL)')
+    return conn
+
+def get_cached(key):
+    """Return the cached value for key, or None if missing or expired."""
+    try:
+        with closing(_connect()) as conn:
+            row = conn.execute('SELECT value FROM responses WHERE key = ? AND created > ?',
+                               (key, time.time() - CACHE_TTL)).fetchone()
+    except (sqlite3.Error, OSError):
+        return None
+    return row[0] if row else None
+
+def get_cached_many(keys):
+    """Return a dict of the unexpired cached values for keys, in one query."""
+    if not keys:
+        return {}
+    placeholders = ', '.join('?' * len(keys))
+    try:
+        with closing(_connect()) as conn:
+            rows = conn.execute(f'SELECT key, value FROM responses WHERE key IN ({placeholders}) AND created > ?',
+                                (*keys, time.time() - CACHE_TTL)).fetchall()
+    except (sqlite3.Error, OSError):
+        return {}
+    return dict(rows)
+
+def set_cached(key, value):
+    """Store value under key; cache failures never interrupt a lookup."""
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)',
+                         (key, value, time.time()))
+    except (sqlite3.Error, OSError):
+        pass
+
+def set_cached_many(items):
+    """Store several (key, value) pairs in a single transaction."""
+    if not items:
+        return
+    now = time.time()
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)',
+                             [(key, value, now) for key, value in items])
+    except (sqlite3.Error, OSError):
+        pass